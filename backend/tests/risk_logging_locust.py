@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Risk Logging Load Test
+Locust user that drives the risk-detecting chat endpoint for throughput runs.
+test_risk_logging.py remains the correctness check; this file is for load only.
+
+Run with:
+    locust -f risk_logging_locust.py --headless -u 100 -r 50 -t 30s --host http://localhost:8000
+"""
+
+import uuid
+
+from locust import FastHttpUser, constant, task
+
+from test_risk_logging import API_KEY_BODY, DATA_REQUEST_BODY, HIGH_RISK_BODY, LOW_RISK_BODY, _dumps
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+CHAT_PATH = "/v1/chat/completions"
+
+
+class RiskUser(FastHttpUser):
+    """One synthetic account sending chat probes back to back"""
+
+    wait_time = constant(0)
+
+    def on_start(self):
+        """Register, log in and issue an API key once per simulated user"""
+        email = f"loaduser_{uuid.uuid4().hex[:12]}@example.com"
+        password = "RiskTest123!"
+
+        self.client.post(
+            "/api/v1/auth/register",
+            data=_dumps({"email": email, "password": password, "full_name": "Risk Load User"}),
+            headers=JSON_HEADERS
+        )
+        login = self.client.post(
+            "/api/v1/auth/login",
+            data=_dumps({"email": email, "password": password}),
+            headers=JSON_HEADERS
+        )
+        auth_headers = {**JSON_HEADERS, "Authorization": f"Bearer {login.json()['access_token']}"}
+
+        key = self.client.post("/api/v1/api-keys", data=API_KEY_BODY, headers=auth_headers)
+        self.key_headers = {**JSON_HEADERS, "Authorization": f"Bearer {key.json()['api_key']}"}
+
+    @task
+    def low_risk_chat(self):
+        self.client.post(CHAT_PATH, data=LOW_RISK_BODY, headers=self.key_headers, name="chat: low risk")
+
+    @task
+    def high_risk_chat(self):
+        self.client.post(CHAT_PATH, data=HIGH_RISK_BODY, headers=self.key_headers, name="chat: high risk")
+
+    @task
+    def data_access_chat(self):
+        self.client.post(CHAT_PATH, data=DATA_REQUEST_BODY, headers=self.key_headers, name="chat: data access")
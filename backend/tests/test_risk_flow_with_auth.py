@@ -4,145 +4,267 @@ Authenticated Risk Detection and Mitigation Flow Test
 Tests the complete flow from login to chat completion to risk detection to dashboard display
 """
 
-import requests
+import argparse
+import asyncio
+import contextlib
+import functools
+import httpx
 import json
+import multiprocessing
+import os
+import re
 import time
 from datetime import datetime
 
+try:
+    import h2  # noqa: F401 - enables HTTP/2 support in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
 # Configuration
 BACKEND_URL = "http://localhost:8000"
 FRONTEND_URL = "http://localhost:3000"
+JSON_HEADERS = {"Content-Type": "application/json"}
+MAX_RESPONSE_BYTES = 1024 * 1024
+
+# SSNs, card numbers, emails and US phone numbers that should never survive sanitization
+_PII_RE = re.compile(
+    r"\b(?:\d{3}-\d{2}-\d{4}|\d{4}-\d{4}-\d{4}-\d{4}|[\w.+-]+@[\w-]+\.[\w.-]+)\b"
+    r"|\(\d{3}\) \d{3}-\d{4}"
+)
+
+# Fixed request payloads, serialized once at import
+CHAT_BODY = _dumps({
+    "model": "llama-3.3-70b-versatile",
+    "messages": [
+        {
+            "role": "user", 
+            "content": "Hello, my name is John Smith and my email is john.smith@company.com. Can you help me with my credit card number 1234-5678-9012-3456?"
+        }
+    ],
+    "max_tokens": 150,
+    "temperature": 0.7
+})
+RISK_BODY = _dumps({
+    "text": "My personal information: John Doe, SSN: 123-45-6789, Phone: (555) 123-4567, Address: 123 Main St, Anytown, USA 12345. I need help with my bank account.",
+    "enable_sanitization": True
+})
+
+def _json(response):
+    """Decode a response body, using orjson when it is installed"""
+    return _loads(response.content)
+
+def _safe_loads(body):
+    """Decode an error body, falling back to its raw text when it isn't JSON"""
+    try:
+        return _loads(body)
+    except ValueError:
+        return {"detail": body[:200].decode("utf-8", errors="replace")}
+
+def _safe_json(response):
+    """Decode an error response without letting a non-JSON body mask the status"""
+    return _safe_loads(response.content)
+
+async def _read_limited(response, limit=MAX_RESPONSE_BYTES):
+    """Read a streamed response body, refusing anything larger than limit bytes"""
+    declared = response.headers.get("content-length")
+    if declared and int(declared) > limit:
+        raise ValueError(f"Response of {declared} bytes exceeds {limit} byte limit")
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes(8192):
+        size += len(chunk)
+        if size > limit:
+            raise ValueError(f"Response exceeds {limit} byte limit")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def require_auth(test_name):
+    """Fail the decorated test up front when login did not yield a token.
+    
+    Every authenticated call makes the backend verify the JWT and load the
+    user again; caching get_current_user server-side (e.g. a short-TTL cache
+    keyed on a hash of the token) would let these probes skip that work.
+    """
+    def decorator(test):
+        @functools.wraps(test)
+        async def wrapper(self, *args, **kwargs):
+            if not self.auth_token:
+                return self.log_test(test_name, False, "No auth token available")
+            return await test(self, *args, **kwargs)
+        return wrapper
+    return decorator
 
 class AuthenticatedRiskTester:
-    def __init__(self):
-        self.session = requests.Session()
+    # Endpoint paths, relative to the client's base_url
+    HEALTH_URL = "/health"
+    REGISTER_URL = "/api/v1/auth/register"
+    LOGIN_URL = "/api/v1/auth/login"
+    CHAT_URL = "/v1/chat/completions"
+    RISK_URL = "/api/v1/risk/analyze"
+    STATS_URL = "/api/v1/analytics/statistics?days=1"
+    LOGS_URL = "/api/v1/analytics/logs?limit=5&offset=0&days=1"
+    
+    def __init__(self, verbose=True, worker_id=None):
+        self.verbose = verbose
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.worker_id = worker_id
+        # Keep a warm keep-alive pool to the backend and retry failed connects;
+        # with h2 installed, concurrent probes multiplex over one connection
+        limits = httpx.Limits(max_keepalive_connections=8)
+        self.client = httpx.AsyncClient(
+            base_url=BACKEND_URL,
+            timeout=30,
+            transport=httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, retries=2, limits=limits)
+        )
         self.auth_token = None
         self.user_id = None
-        self.test_results = {}
+        self.test_email = None
+        self.test_results = []
+        self.passed = 0
+        self.failed = 0
+        # Cleared while write probes are in flight; set otherwise so readers run immediately
+        self.writes_done = asyncio.Event()
+        self.writes_done.set()
         
-    def log_test(self, test_name, success, details=""):
-        """Log test results"""
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        # Release pooled sockets even if a run is interrupted
+        await self.client.aclose()
+    
+    def log_test(self, test_name, success, details="", details_fn=None):
+        """Log test results; details of passing tests are only built when verbose"""
         status = "✅ PASS" if success else "❌ FAIL"
         print(f"{status} {test_name}")
+        if success and not self.verbose:
+            details = ""
+        elif details_fn:
+            details = details_fn()
         if details:
             print(f"   {details}")
-        self.test_results[test_name] = {"success": success, "details": details}
+        self.test_results.append((test_name, success, details))
+        if success:
+            self.passed += 1
+        else:
+            self.failed += 1
         return success
     
-    def test_backend_health(self):
+    async def test_backend_health(self):
         """Test backend health endpoint"""
         print("🔍 Testing Backend Health...")
         try:
-            response = self.session.get(f"{BACKEND_URL}/health", timeout=5)
+            response = await self.client.get(self.HEALTH_URL, timeout=5)
             if response.status_code == 200:
-                data = response.json()
-                return self.log_test("Backend Health", True, 
-                    f"Status: {data.get('status')}, Database: {data.get('database_status')}")
+                data = _json(response)
+                return self.log_test("Backend Health", True,
+                    details_fn=lambda: f"Status: {data.get('status')}, Database: {data.get('database_status')}")
             else:
                 return self.log_test("Backend Health", False, f"Status: {response.status_code}")
         except Exception as e:
             return self.log_test("Backend Health", False, f"Error: {e}")
     
-    def test_user_registration(self):
+    async def test_user_registration(self):
         """Test user registration"""
         print("\n🔍 Testing User Registration...")
         try:
-            # Generate unique email
-            timestamp = int(time.time())
-            test_email = f"riskuser{timestamp}@example.com"
+            # Generate unique email, remembered for the login step
+            suffix = "" if self.worker_id is None else f"w{self.worker_id}"
+            self.test_email = f"riskuser{int(time.time())}{suffix}@example.com"
             
             registration_data = {
-                "email": test_email,
+                "email": self.test_email,
                 "password": "RiskTest123!",
                 "full_name": "Risk Test User"
             }
             
-            response = self.session.post(
-                f"{BACKEND_URL}/api/v1/auth/register",
-                json=registration_data,
+            response = await self.client.post(
+                self.REGISTER_URL,
+                content=_dumps(registration_data),
+                headers=JSON_HEADERS,
                 timeout=10
             )
             
             if response.status_code in [200, 201]:
-                data = response.json()
+                data = _json(response)
                 self.user_id = data.get("id")
-                print(f"   📧 Test Account Created: {test_email}")
+                print(f"   📧 Test Account Created: {self.test_email}")
                 print(f"   🔑 Password: RiskTest123!")
-                return self.log_test("User Registration", True, 
-                    f"User ID: {self.user_id}, Email: {test_email}")
+                return self.log_test("User Registration", True,
+                    details_fn=lambda: f"User ID: {self.user_id}, Email: {self.test_email}")
             else:
-                data = response.json()
+                data = _safe_json(response)
                 return self.log_test("User Registration", False, 
                     f"Status: {response.status_code}, Error: {data.get('detail', 'Unknown')}")
         except Exception as e:
             return self.log_test("User Registration", False, f"Error: {e}")
     
-    def test_user_login(self):
+    async def test_user_login(self):
         """Test user login"""
         print("\n🔍 Testing User Login...")
         try:
-            # Generate unique email (same as registration)
-            timestamp = int(time.time())
-            test_email = f"riskuser{timestamp}@example.com"
-            
             login_data = {
-                "email": test_email,
+                "email": self.test_email,
                 "password": "RiskTest123!"
             }
             
-            response = self.session.post(
-                f"{BACKEND_URL}/api/v1/auth/login",
-                json=login_data,
+            response = await self.client.post(
+                self.LOGIN_URL,
+                content=_dumps(login_data),
+                headers=JSON_HEADERS,
                 timeout=10
             )
             
             if response.status_code == 200:
-                data = response.json()
+                data = _json(response)
                 self.auth_token = data.get("access_token")
                 if self.auth_token:
-                    # Set authorization header for future requests
-                    self.session.headers.update({"Authorization": f"Bearer {self.auth_token}"})
+                    # Set the authorization header once; every later request inherits it
+                    self.client.headers["Authorization"] = f"Bearer {self.auth_token}"
                     print(f"   🔐 Authentication Token: {self.auth_token[:20]}...")
-                    return self.log_test("User Login", True, 
-                        f"Token received: {self.auth_token[:20]}...")
+                    return self.log_test("User Login", True,
+                        details_fn=lambda: f"Token received: {self.auth_token[:20]}...")
                 else:
                     return self.log_test("User Login", False, "No access token received")
             else:
-                data = response.json()
+                data = _safe_json(response)
                 return self.log_test("User Login", False, 
                     f"Status: {response.status_code}, Error: {data.get('detail', 'Unknown')}")
         except Exception as e:
             return self.log_test("User Login", False, f"Error: {e}")
     
-    def test_chat_with_risk_detection(self):
+    @require_auth("Chat with Risk Detection")
+    async def test_chat_with_risk_detection(self):
         """Test chat completion with risk detection enabled"""
-        print("\n🔍 Testing Chat Completion with Risk Detection...")
-        
-        if not self.auth_token:
-            return self.log_test("Chat with Risk Detection", False, "No auth token available")
-        
         try:
-            # Test with potentially risky content
-            chat_data = {
-                "model": "llama-3.3-70b-versatile",
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": "Hello, my name is John Smith and my email is john.smith@company.com. Can you help me with my credit card number 1234-5678-9012-3456?"
-                    }
-                ],
-                "max_tokens": 150,
-                "temperature": 0.7
-            }
-            
-            response = self.session.post(
-                f"{BACKEND_URL}/v1/chat/completions",
-                json=chat_data,
+            # Test with potentially risky content; the completion is streamed
+            # so an oversized body is rejected before it is fully buffered
+            async with self.client.stream(
+                "POST",
+                self.CHAT_URL,
+                content=CHAT_BODY,
+                headers=JSON_HEADERS,
                 timeout=30
-            )
+            ) as response:
+                body = await _read_limited(response)
+            # Announce the probe only once it has returned, so output from
+            # the concurrently running probes does not interleave
+            print("\n🔍 Testing Chat Completion with Risk Detection...")
             
             if response.status_code == 200:
-                data = response.json()
+                data = _loads(body)
                 choices = data.get("choices", [])
                 
                 if choices:
@@ -159,44 +281,37 @@ class AuthenticatedRiskTester:
                     
                     # Check if response was sanitized
                     response_content = choices[0].get("message", {}).get("content", "")
-                    if "john.smith@company.com" not in response_content and "1234-5678-9012-3456" not in response_content:
+                    if not _PII_RE.search(response_content):
                         sanitization_status = "✅ Content was sanitized (PII removed)"
                     else:
                         sanitization_status = "⚠️ Content may contain PII (not sanitized)"
                     
-                    return self.log_test("Chat with Risk Detection", True, 
-                        f"Response received, Risk Score: {risk_score}, {sanitization_status}")
+                    return self.log_test("Chat with Risk Detection", True,
+                        details_fn=lambda: f"Response received, Risk Score: {risk_score}, {sanitization_status}")
                 else:
                     return self.log_test("Chat with Risk Detection", False, "No choices in response")
             else:
-                data = response.json()
+                data = _safe_loads(body)
                 return self.log_test("Chat with Risk Detection", False, 
                     f"Status: {response.status_code}, Error: {data.get('detail', 'Unknown')}")
         except Exception as e:
             return self.log_test("Chat with Risk Detection", False, f"Error: {e}")
     
-    def test_risk_analysis_endpoint(self):
+    @require_auth("Direct Risk Analysis")
+    async def test_risk_analysis_endpoint(self):
         """Test direct risk analysis endpoint"""
-        print("\n🔍 Testing Direct Risk Analysis...")
-        
-        if not self.auth_token:
-            return self.log_test("Direct Risk Analysis", False, "No auth token available")
-        
         try:
             # Test with high-risk content
-            risk_data = {
-                "text": "My personal information: John Doe, SSN: 123-45-6789, Phone: (555) 123-4567, Address: 123 Main St, Anytown, USA 12345. I need help with my bank account.",
-                "enable_sanitization": True
-            }
-            
-            response = self.session.post(
-                f"{BACKEND_URL}/api/v1/risk/analyze",
-                json=risk_data,
+            response = await self.client.post(
+                self.RISK_URL,
+                content=RISK_BODY,
+                headers=JSON_HEADERS,
                 timeout=15
             )
+            print("\n🔍 Testing Direct Risk Analysis...")
             
             if response.status_code == 200:
-                data = response.json()
+                data = _json(response)
                 risk_score = data.get("overall_risk_score", "Unknown")
                 risk_level = data.get("risk_level", "Unknown")
                 risk_factors = data.get("risk_factors", [])
@@ -210,39 +325,51 @@ class AuthenticatedRiskTester:
                 print(f"      Mitigation Suggestions: {mitigation_suggestions}")
                 
                 # Check if text was sanitized
-                if sanitized_text and ("123-45-6789" not in sanitized_text and "(555) 123-4567" not in sanitized_text):
+                if sanitized_text and not _PII_RE.search(sanitized_text):
                     sanitization_status = "✅ Text was properly sanitized"
                 else:
                     sanitization_status = "⚠️ Text may not be fully sanitized"
                 
-                return self.log_test("Direct Risk Analysis", True, 
-                    f"Risk Score: {risk_score}, {sanitization_status}")
+                return self.log_test("Direct Risk Analysis", True,
+                    details_fn=lambda: f"Risk Score: {risk_score}, {sanitization_status}")
             else:
-                data = response.json()
+                data = _safe_json(response)
                 return self.log_test("Direct Risk Analysis", False, 
                     f"Status: {response.status_code}, Error: {data.get('detail', 'Unknown')}")
         except Exception as e:
             return self.log_test("Direct Risk Analysis", False, f"Error: {e}")
     
-    def test_analytics_data_after_risk_detection(self):
-        """Test if risk detection events are saved and visible in analytics"""
-        print("\n🔍 Testing Analytics Data After Risk Detection...")
-        
-        if not self.auth_token:
-            return self.log_test("Analytics Data", False, "No auth token available")
+    async def _poll_statistics(self, budget=3.0):
+        """Fetch analytics statistics, backing off exponentially until requests are recorded.
         
-        try:
-            # Wait a moment for data to be processed
-            time.sleep(2)
-            
-            # Check analytics statistics
-            stats_response = self.session.get(
-                f"{BACKEND_URL}/api/v1/analytics/statistics?days=1",
+        A non-200 is returned at once rather than polled until the deadline.
+        """
+        deadline = time.monotonic() + budget
+        delay = 0.05
+        while True:
+            response = await self.client.get(
+                self.STATS_URL,
                 timeout=10
             )
+            if response.status_code != 200 or _json(response).get('total_requests', 0) > 0:
+                return response
+            if time.monotonic() + delay >= deadline:
+                return response
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.7, 0.4)
+    
+    @require_auth("Analytics Data")
+    async def test_analytics_data_after_risk_detection(self):
+        """Test if risk detection events are saved and visible in analytics"""
+        try:
+            await self.writes_done.wait()
+            
+            # Check analytics statistics, waiting briefly for new data to land
+            stats_response = await self._poll_statistics()
+            print("\n🔍 Testing Analytics Data After Risk Detection...")
             
             if stats_response.status_code == 200:
-                stats_data = stats_response.json()
+                stats_data = _json(stats_response)
                 
                 print(f"   📊 Analytics Statistics:")
                 print(f"      Total Requests: {stats_data.get('total_requests', 'N/A')}")
@@ -253,8 +380,8 @@ class AuthenticatedRiskTester:
                 
                 # Check if we have recent data
                 if stats_data.get('total_requests', 0) > 0:
-                    return self.log_test("Analytics Data", True, 
-                        f"Data available: {stats_data.get('total_requests')} requests")
+                    return self.log_test("Analytics Data", True,
+                        details_fn=lambda: f"Data available: {stats_data.get('total_requests')} requests")
                 else:
                     return self.log_test("Analytics Data", False, "No request data found")
             else:
@@ -263,22 +390,21 @@ class AuthenticatedRiskTester:
         except Exception as e:
             return self.log_test("Analytics Data", False, f"Error: {e}")
     
-    def test_risk_logs_after_detection(self):
+    @require_auth("Risk Logs")
+    async def test_risk_logs_after_detection(self):
         """Test if risk detection events are logged"""
-        print("\n🔍 Testing Risk Logs...")
-        
-        if not self.auth_token:
-            return self.log_test("Risk Logs", False, "No auth token available")
-        
         try:
+            await self.writes_done.wait()
+            
             # Check recent risk logs
-            logs_response = self.session.get(
-                f"{BACKEND_URL}/api/v1/analytics/logs?limit=5&offset=0&days=1",
+            logs_response = await self.client.get(
+                self.LOGS_URL,
                 timeout=10
             )
+            print("\n🔍 Testing Risk Logs...")
             
             if logs_response.status_code == 200:
-                logs_data = logs_response.json()
+                logs_data = _json(logs_response)
                 
                 if logs_data and len(logs_data) > 0:
                     print(f"   📋 Recent Risk Logs ({len(logs_data)} entries):")
@@ -290,8 +416,8 @@ class AuthenticatedRiskTester:
                         
                         print(f"      Log {i+1}: Score {risk_score} ({risk_level}), Factors: {risk_factors[:2]}")
                     
-                    return self.log_test("Risk Logs", True, 
-                        f"Found {len(logs_data)} risk log entries")
+                    return self.log_test("Risk Logs", True,
+                        details_fn=lambda: f"Found {len(logs_data)} risk log entries")
                 else:
                     return self.log_test("Risk Logs", False, "No risk logs found")
             else:
@@ -300,28 +426,39 @@ class AuthenticatedRiskTester:
         except Exception as e:
             return self.log_test("Risk Logs", False, f"Error: {e}")
     
-    def run_complete_test(self):
+    async def run_complete_test(self):
         """Run complete authenticated risk mitigation flow test"""
         print("🚀 Authenticated Risk Detection and Mitigation Flow Test")
         print("=" * 70)
         print(f"Backend URL: {BACKEND_URL}")
-        print(f"Test Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Test Time: {self.started_at}")
         print("=" * 70)
         
-        # Run tests in sequence
-        tests = [
-            self.test_backend_health,
-            self.test_user_registration,
-            self.test_user_login,
-            self.test_chat_with_risk_detection,
-            self.test_risk_analysis_endpoint,
-            self.test_analytics_data_after_risk_detection,
-            self.test_risk_logs_after_detection
-        ]
+        # Open the pooled connection up front so DNS and handshake costs
+        # don't skew the first measured request
+        try:
+            await self.client.get(self.HEALTH_URL, timeout=5)
+        except httpx.HTTPError:
+            pass
+        
+        # Health, registration and login must run in sequence
+        await self.test_backend_health()
+        await self.test_user_registration()
+        await self.test_user_login()
         
-        for test in tests:
-            test()
-            time.sleep(1)  # Small delay between tests
+        # Run the authenticated probes concurrently; the analytics readers
+        # wait on an event that is set once both write probes have finished
+        self.writes_done.clear()
+        writes = asyncio.gather(
+            self.test_chat_with_risk_detection(),
+            self.test_risk_analysis_endpoint()
+        )
+        writes.add_done_callback(lambda _: self.writes_done.set())
+        await asyncio.gather(
+            writes,
+            self.test_risk_logs_after_detection(),
+            self.test_analytics_data_after_risk_detection()
+        )
         
         # Generate summary
         self.generate_summary()
@@ -332,9 +469,9 @@ class AuthenticatedRiskTester:
         print("📊 AUTHENTICATED RISK MITIGATION FLOW TEST SUMMARY")
         print("=" * 70)
         
-        total_tests = len(self.test_results)
-        passed_tests = sum(1 for result in self.test_results.values() if result["success"])
-        failed_tests = total_tests - passed_tests
+        passed_tests = self.passed
+        failed_tests = self.failed
+        total_tests = passed_tests + failed_tests
         
         print(f"Total Tests: {total_tests}")
         print(f"Passed: {passed_tests}")
@@ -342,11 +479,11 @@ class AuthenticatedRiskTester:
         print(f"Success Rate: {(passed_tests/total_tests)*100:.1f}%")
         
         print("\nDetailed Results:")
-        for test_name, result in self.test_results.items():
-            status = "✅ PASS" if result["success"] else "❌ FAIL"
+        for test_name, success, details in self.test_results:
+            status = "✅ PASS" if success else "❌ FAIL"
             print(f"{status} {test_name}")
-            if result["details"]:
-                print(f"   {result['details']}")
+            if details:
+                print(f"   {details}")
         
         if passed_tests == total_tests:
             print("\n🎉 ALL TESTS PASSED!")
@@ -375,10 +512,53 @@ class AuthenticatedRiskTester:
         print("4. Verify risk detection numbers increased")
         print("5. Check risk logs at /dashboard/risk-detection")
 
+async def _run(worker_id=None, verbose=True):
+    """Run the full flow with a tester whose client is closed afterwards"""
+    async with AuthenticatedRiskTester(verbose=verbose, worker_id=worker_id) as tester:
+        await tester.run_complete_test()
+    return tester
+
+def _run_quiet(worker_id=None):
+    """Run the full flow with its progress output discarded; return (passed, failures)"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tester = asyncio.run(_run(worker_id, verbose=False))
+    failures = [(name, details) for name, success, details in tester.test_results if not success]
+    return tester.passed, failures
+
 def main():
     """Main function"""
-    tester = AuthenticatedRiskTester()
-    tester.run_complete_test()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of synthetic users to run in parallel processes")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only report failing tests and the pass count (implied by --workers > 1)")
+    args = parser.parse_args()
+    
+    if args.workers <= 1 and not args.quiet:
+        asyncio.run(_run())
+        return
+    
+    # Parallel workers always run quiet, since their progress output would
+    # interleave line by line; failures are reported here once all finish
+    if args.workers <= 1:
+        all_results = [_run_quiet()]
+    else:
+        with multiprocessing.Pool(args.workers) as pool:
+            all_results = pool.map(_run_quiet, range(args.workers))
+    
+    for worker_id, (_, failures) in enumerate(all_results):
+        prefix = f"[worker {worker_id}] " if args.workers > 1 else ""
+        for name, details in failures:
+            print(f"❌ FAIL {prefix}{name}")
+            if details:
+                print(f"   {details}")
+    
+    passed = sum(p for p, _ in all_results)
+    total = passed + sum(len(f) for _, f in all_results)
+    print("\n" + "=" * 70)
+    label = f"{args.workers} WORKERS" if args.workers > 1 else "AUTHENTICATED RISK MITIGATION FLOW"
+    print(f"📊 {label}: {passed}/{total} tests passed")
+    print("=" * 70)
 
 if __name__ == "__main__":
     main()
@@ -4,39 +4,183 @@ Comprehensive Risk Logging Test
 Tests the complete risk detection and logging flow to ensure data is properly saved
 """
 
-import requests
+import argparse
+import asyncio
+import httpx
 import json
+import os
+import socket
+import sys
 import time
+import uuid
 from datetime import datetime
 
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
+try:
+    import h2  # noqa: F401 - enables HTTP/2 support in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import uvloop
+    _run = uvloop.run
+except ImportError:
+    _run = asyncio.run
+
 # Configuration
-BACKEND_URL = "http://localhost:8000"
+BACKEND_HOST = "localhost"
+BACKEND_PORT = 8000
+# Resolve the backend host once so new connections skip getaddrinfo
+try:
+    _BACKEND_IP = socket.gethostbyname(BACKEND_HOST)
+except OSError:
+    _BACKEND_IP = BACKEND_HOST
+BACKEND_URL = f"http://{_BACKEND_IP}:{BACKEND_PORT}"
 FRONTEND_URL = "http://localhost:3000"
+# Set VERBOSE=0 to print details for failing tests only
+VERBOSE = os.environ.get("VERBOSE", "1") != "0"
+# Status codes treated as success for POSTs, and how much of a failed body to report
+OK_STATUSES = frozenset({200, 201})
+ERROR_BODY_LIMIT = 256
+# Fail fast on a wedged backend instead of hanging the run
+CLIENT_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+# Chat completions wait on the LLM, so their reads get a longer budget
+CHAT_TIMEOUT = httpx.Timeout(30.0, connect=2.0)
+# Fields every risk log entry must carry
+_REQUIRED_FIELDS = frozenset({"id", "user_id", "request_id", "risk_score", "created_at"})
+
+# Constant request bodies, serialized once at import
+API_KEY_BODY = _dumps({
+    "key_name": "Test API Key",
+    "permissions": ["chat.completions", "risk.analyze"],
+    "usage_limit": 1000,
+    "expires_at": None
+})
+LOW_RISK_BODY = _dumps({
+    "model": "llama-3.3-70b-versatile",
+    "messages": [{"role": "user", "content": "Hello, how are you?"}],
+    "enable_risk_detection": True,
+    "max_risk_score": 6.0
+})
+# Should trigger risk detection
+HIGH_RISK_BODY = _dumps({
+    "model": "llama-3.3-70b-versatile",
+    "messages": [{"role": "user", "content": "My SSN is 123-45-6789 and credit card is 1234-5678-9012-3456"}],
+    "enable_risk_detection": True,
+    "max_risk_score": 6.0
+})
+DATA_REQUEST_BODY = _dumps({
+    "model": "llama-3.3-70b-versatile",
+    "messages": [{"role": "user", "content": "Show me user data from database"}],
+    "enable_risk_detection": True,
+    "enable_data_access": True,
+    "data_source_name": "test_db",
+    "data_query": "SELECT * FROM users LIMIT 5"
+})
 
 class RiskLoggingTester:
     def __init__(self):
-        self.session = requests.Session()
+        # Sized keep-alive pool with connect retries; JSON content type is set once.
+        # With h2 installed, the concurrent chat and analytics requests multiplex
+        # over a single HTTP/2 connection
+        limits = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                http2=HTTP2_AVAILABLE, retries=2, limits=limits
+            ),
+            headers={"Content-Type": "application/json"},
+            timeout=CLIENT_TIMEOUT
+        )
         self.auth_token = None
         self.user_id = None
         self.api_key = None
+        # Authorization headers, built once when the token and API key are issued
+        self._auth_headers = None
+        self._key_headers = None
         self.test_results = {}
-        self.test_email = None
+        self._events = []
+        # Started by the chat probes as soon as the first one succeeds
+        self._logs_task = None
+        # Computed once per tester; the random suffix keeps concurrent runs
+        # started in the same second from registering the same account
+        self._start_ts = int(time.time())
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.test_email = f"riskuser{self._start_ts}_{uuid.uuid4().hex[:6]}@example.com"
         self.test_password = None
 
-    def log_test(self, test_name, success, details=""):
-        """Log test results"""
-        status = "✅ PASS" if success else "❌ FAIL"
-        print(f"{status} {test_name}")
-        if details:
-            print(f"   {details}")
-        self.test_results[test_name] = {"success": success, "details": details}
-
-    def test_backend_health(self):
+    def log_test(self, test_name, success, details="", details_fn=None):
+        """Record a test result; details of passing tests are only built when VERBOSE.
+
+        Output is buffered until flush_events.
+        """
+        if success and not VERBOSE:
+            details = ""
+        elif details_fn:
+            details = details_fn()
+        self.test_results[test_name] = (success, details)
+        self._events.append((test_name, success, details))
+
+    def flush_events(self):
+        """Write all buffered test results to stdout in one call"""
+        if not self._events:
+            return
+        lines = []
+        for test_name, success, details in self._events:
+            lines.append(f"{'✅ PASS' if success else '❌ FAIL'} {test_name}")
+            if details:
+                lines.append(f"   {details}")
+        self._events.clear()
+        sys.stdout.write("\n".join(lines) + "\n")
+
+    def stop(self, message):
+        """Flush buffered results, then report why the run is stopping"""
+        self.flush_events()
+        print(message)
+
+    async def _post_json(self, label, url, payload, headers=None, ok=OK_STATUSES, timeout=CLIENT_TIMEOUT):
+        """POST payload (a dict, or bytes already serialized) to url and return the decoded JSON.
+
+        On a non-ok status the failure is logged under label with the status and
+        a truncated body, and None is returned.
+        """
+        body = payload if isinstance(payload, bytes) else _dumps(payload)
+        response = await self.client.post(url, content=body, headers=headers, timeout=timeout)
+        if response.status_code in ok:
+            return _loads(response.content) if response.content else {}
+        error_text = response.content[:ERROR_BODY_LIMIT].decode("utf-8", errors="replace")
+        self.log_test(label, False, f"Status: {response.status_code}, Response: {error_text}")
+        return None
+
+    async def poll_until_ready(self, url, headers, ready, timeout=3.0, interval=0.05):
+        """GET url until ready(json) is true or timeout expires; return the last response.
+        
+        Any non-200 is returned at once; only data that has not landed yet is worth polling for.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            response = await self.client.get(url, headers=headers)
+            if response.status_code != 200 or ready(_loads(response.content)):
+                return response
+            if time.monotonic() >= deadline:
+                return response
+            await asyncio.sleep(interval)
+
+    async def test_backend_health(self):
         """Test backend health"""
         try:
-            response = self.session.get(f"{BACKEND_URL}/health")
+            response = await self.client.get(f"{BACKEND_URL}/health")
             if response.status_code == 200:
-                self.log_test("Backend Health", True, f"Status: {response.status_code}")
+                self.log_test("Backend Health", True, details_fn=lambda: f"Status: {response.status_code}")
                 return True
             else:
                 self.log_test("Backend Health", False, f"Status: {response.status_code}")
@@ -45,11 +189,9 @@ class RiskLoggingTester:
             self.log_test("Backend Health", False, f"Error: {e}")
             return False
 
-    def test_user_registration(self):
-        """Test user registration"""
+    async def test_user_registration(self):
+        """Test user registration; a connection failure here is reported as an unhealthy backend"""
         try:
-            timestamp = int(time.time())
-            self.test_email = f"riskuser{timestamp}@example.com"
             self.test_password = "RiskTest123!"
 
             registration_data = {
@@ -58,25 +200,25 @@ class RiskLoggingTester:
                 "full_name": "Risk Test User"
             }
 
-            response = self.session.post(
-                f"{BACKEND_URL}/api/v1/auth/register",
-                json=registration_data
-            )
-
-            if response.status_code in [200, 201]:
-                user_data = response.json()
-                self.user_id = user_data.get("id")
-                self.log_test("User Registration", True, f"User ID: {self.user_id}")
-                return True
-            else:
-                self.log_test("User Registration", False, f"Status: {response.status_code}")
+            try:
+                user_data = await self._post_json(
+                    "User Registration", f"{BACKEND_URL}/api/v1/auth/register", registration_data
+                )
+            except (httpx.ConnectError, httpx.TimeoutException) as e:
+                self.log_test("Backend Health", False, f"Error: {e}")
+                return False
+            if user_data is None:
                 return False
 
+            self.user_id = user_data.get("id")
+            self.log_test("User Registration", True, details_fn=lambda: f"User ID: {self.user_id}")
+            return True
+
         except Exception as e:
             self.log_test("User Registration", False, f"Error: {e}")
             return False
 
-    def test_user_login(self):
+    async def test_user_login(self):
         """Test user login"""
         try:
             if not self.test_email or not self.test_password:
@@ -88,132 +230,76 @@ class RiskLoggingTester:
                 "password": self.test_password
             }
 
-            response = self.session.post(
-                f"{BACKEND_URL}/api/v1/auth/login",
-                json=login_data
-            )
-
-            if response.status_code == 200:
-                login_data = response.json()
-                self.auth_token = login_data.get("access_token")
-                self.log_test("User Login", True, f"Token: {self.auth_token[:20]}...")
-                return True
-            else:
-                self.log_test("User Login", False, f"Status: {response.status_code}, Response: {response.text}")
+            login_data = await self._post_json("User Login", f"{BACKEND_URL}/api/v1/auth/login", login_data)
+            if login_data is None:
                 return False
 
+            self.auth_token = login_data.get("access_token")
+            self._auth_headers = {"Authorization": f"Bearer {self.auth_token}"}
+            self.log_test("User Login", True, details_fn=lambda: f"Token: {self.auth_token[:20]}...")
+            return True
+
         except Exception as e:
             self.log_test("User Login", False, f"Error: {e}")
             return False
 
-    def test_create_api_key(self):
+    async def test_create_api_key(self):
         """Test API key creation"""
         try:
             if not self.auth_token:
                 self.log_test("API Key Creation", False, "No auth token")
                 return False
 
-            headers = {
-                "Authorization": f"Bearer {self.auth_token}",
-                "Content-Type": "application/json"
-            }
-
-            api_key_data = {
-                "key_name": "Test API Key",
-                "permissions": ["chat.completions", "risk.analyze"],
-                "usage_limit": 1000,
-                "expires_at": None
-            }
-
-            response = self.session.post(
-                f"{BACKEND_URL}/api/v1/api-keys",
-                json=api_key_data,
-                headers=headers
+            key_response = await self._post_json(
+                "API Key Creation", f"{BACKEND_URL}/api/v1/api-keys", API_KEY_BODY, self._auth_headers
             )
-
-            if response.status_code == 200:
-                key_response = response.json()
-                self.api_key = key_response.get("api_key")
-                self.log_test("API Key Creation", True, f"API Key: {self.api_key[:20]}...")
-                return True
-            else:
-                self.log_test("API Key Creation", False, f"Status: {response.status_code}, Response: {response.text}")
+            if key_response is None:
                 return False
 
+            self.api_key = key_response.get("api_key")
+            self._key_headers = {"Authorization": f"Bearer {self.api_key}"}
+            self.log_test("API Key Creation", True, details_fn=lambda: f"API Key: {self.api_key[:20]}...")
+            return True
+
         except Exception as e:
             self.log_test("API Key Creation", False, f"Error: {e}")
             return False
 
-    def test_chat_with_risk_detection(self):
+    async def _post_chat(self, body, label, success_message):
+        """Send one pre-serialized chat completion probe and log its outcome under label.
+
+        Errors are logged here rather than raised, so one failing probe can't
+        abandon the others still in flight.
+        """
+        try:
+            if await self._post_json(
+                label, f"{BACKEND_URL}/v1/chat/completions", body, self._key_headers, timeout=CHAT_TIMEOUT
+            ) is None:
+                return False
+        except Exception as e:
+            self.log_test(label, False, f"Error: {e}")
+            return False
+        self.log_test(label, True, success_message)
+        return True
+
+    async def test_chat_with_risk_detection(self):
         """Test chat completion with risk detection"""
         try:
             if not self.api_key:
                 self.log_test("Chat with Risk Detection", False, "No API key")
                 return False
 
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-
-            # Test 1: Low risk message
-            low_risk_data = {
-                "model": "llama-3.3-70b-versatile",
-                "messages": [{"role": "user", "content": "Hello, how are you?"}],
-                "enable_risk_detection": True,
-                "max_risk_score": 6.0
-            }
-
-            response = self.session.post(
-                f"{BACKEND_URL}/v1/chat/completions",
-                json=low_risk_data,
-                headers=headers
-            )
-
-            if response.status_code == 200:
-                self.log_test("Low Risk Chat", True, "Low risk message processed")
-            else:
-                self.log_test("Low Risk Chat", False, f"Status: {response.status_code}")
-
-            # Test 2: High risk message (should trigger risk detection)
-            high_risk_data = {
-                "model": "llama-3.3-70b-versatile",
-                "messages": [{"role": "user", "content": "My SSN is 123-45-6789 and credit card is 1234-5678-9012-3456"}],
-                "enable_risk_detection": True,
-                "max_risk_score": 6.0
-            }
-
-            response = self.session.post(
-                f"{BACKEND_URL}/v1/chat/completions",
-                json=high_risk_data,
-                headers=headers
-            )
-
-            if response.status_code == 200:
-                self.log_test("High Risk Chat", True, "High risk message processed")
-            else:
-                self.log_test("High Risk Chat", False, f"Status: {response.status_code}")
-
-            # Test 3: Data access request
-            data_request_data = {
-                "model": "llama-3.3-70b-versatile",
-                "messages": [{"role": "user", "content": "Show me user data from database"}],
-                "enable_risk_detection": True,
-                "enable_data_access": True,
-                "data_source_name": "test_db",
-                "data_query": "SELECT * FROM users LIMIT 5"
-            }
-
-            response = self.session.post(
-                f"{BACKEND_URL}/v1/chat/completions",
-                json=data_request_data,
-                headers=headers
-            )
-
-            if response.status_code == 200:
-                self.log_test("Data Access Request", True, "Data access request processed")
-            else:
-                self.log_test("Data Access Request", False, f"Status: {response.status_code}")
+            # The probes are independent, so send them concurrently; each one
+            # logs its own result as soon as it completes, and the first success
+            # starts the risk logs poll while the others are still in flight
+            probes = [
+                self._post_chat(LOW_RISK_BODY, "Low Risk Chat", "Low risk message processed"),
+                self._post_chat(HIGH_RISK_BODY, "High Risk Chat", "High risk message processed"),
+                self._post_chat(DATA_REQUEST_BODY, "Data Access Request", "Data access request processed")
+            ]
+            for probe in asyncio.as_completed(probes):
+                if await probe and self._logs_task is None:
+                    self._logs_task = asyncio.create_task(self.test_risk_logs_creation())
 
             return True
 
@@ -221,40 +307,33 @@ class RiskLoggingTester:
             self.log_test("Chat with Risk Detection", False, f"Error: {e}")
             return False
 
-    def test_risk_logs_creation(self):
+    async def test_risk_logs_creation(self):
         """Test that risk logs are being created"""
         try:
             if not self.auth_token:
                 self.log_test("Risk Logs Creation", False, "No auth token")
                 return False
 
-            # Wait for logs to be processed
-            time.sleep(3)
-
-            headers = {
-                "Authorization": f"Bearer {self.auth_token}"
-            }
-
-            # Check risk logs
-            response = self.session.get(
+            # Check risk logs, polling until they have been processed
+            response = await self.poll_until_ready(
                 f"{BACKEND_URL}/api/v1/analytics/logs?limit=10",
-                headers=headers
+                self._auth_headers,
+                lambda data: len(data) > 0
             )
 
             if response.status_code == 200:
-                logs = response.json()
-                if logs and len(logs) > 0:
-                    self.log_test("Risk Logs Creation", True, f"Found {len(logs)} risk logs")
+                logs = _loads(response.content)
+                if logs:
+                    self.log_test("Risk Logs Creation", True, details_fn=lambda: f"Found {len(logs)} risk logs")
                     
                     # Check log structure
                     first_log = logs[0]
-                    required_fields = ["id", "user_id", "request_id", "risk_score", "created_at"]
-                    missing_fields = [field for field in required_fields if field not in first_log]
+                    missing_fields = _REQUIRED_FIELDS - first_log.keys()
                     
                     if not missing_fields:
                         self.log_test("Risk Log Structure", True, "All required fields present")
                     else:
-                        self.log_test("Risk Log Structure", False, f"Missing fields: {missing_fields}")
+                        self.log_test("Risk Log Structure", False, f"Missing fields: {sorted(missing_fields)}")
                     
                     return True
                 else:
@@ -268,27 +347,24 @@ class RiskLoggingTester:
             self.log_test("Risk Logs Creation", False, f"Error: {e}")
             return False
 
-    def test_analytics_data(self):
+    async def test_analytics_data(self):
         """Test that analytics data is updated"""
         try:
             if not self.auth_token:
                 self.log_test("Analytics Data", False, "No auth token")
                 return False
 
-            headers = {
-                "Authorization": f"Bearer {self.auth_token}"
-            }
-
-            # Check statistics
-            response = self.session.get(
+            # Check statistics, polling until the chat requests are counted
+            response = await self.poll_until_ready(
                 f"{BACKEND_URL}/api/v1/analytics/statistics?days=1",
-                headers=headers
+                self._auth_headers,
+                lambda data: data.get("total_requests", 0) > 0
             )
 
             if response.status_code == 200:
-                stats = response.json()
+                stats = _loads(response.content)
                 if stats.get("total_requests", 0) > 0:
-                    self.log_test("Analytics Statistics", True, f"Total requests: {stats.get('total_requests')}")
+                    self.log_test("Analytics Statistics", True, details_fn=lambda: f"Total requests: {stats.get('total_requests')}")
                 else:
                     self.log_test("Analytics Statistics", False, "No requests found in statistics")
                 
@@ -301,24 +377,20 @@ class RiskLoggingTester:
             self.log_test("Analytics Data", False, f"Error: {e}")
             return False
 
-    def test_real_time_stats(self):
+    async def test_real_time_stats(self):
         """Test real-time statistics"""
         try:
             if not self.auth_token:
                 self.log_test("Real-time Stats", False, "No auth token")
                 return False
 
-            headers = {
-                "Authorization": f"Bearer {self.auth_token}"
-            }
-
-            response = self.session.get(
+            response = await self.client.get(
                 f"{BACKEND_URL}/api/v1/analytics/real-time-stats",
-                headers=headers
+                headers=self._auth_headers
             )
 
             if response.status_code == 200:
-                stats = response.json()
+                stats = _loads(response.content)
                 if "last_hour" in stats:
                     self.log_test("Real-time Stats", True, "Real-time stats retrieved")
                     return True
@@ -333,58 +405,63 @@ class RiskLoggingTester:
             self.log_test("Real-time Stats", False, f"Error: {e}")
             return False
 
-    def run_complete_test(self):
-        """Run all tests"""
+    async def run_complete_test(self, diag=False):
+        """Run all tests; diag adds an explicit health check before registration"""
         print("🚀 Comprehensive Risk Logging Test")
         print("=" * 50)
         print(f"Backend URL: {BACKEND_URL}")
         print(f"Frontend URL: {FRONTEND_URL}")
-        print(f"Test Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Test Time: {self.started_at}")
         print("=" * 50)
 
-        # Run tests in sequence
-        if not self.test_backend_health():
-            print("❌ Backend health check failed. Stopping tests.")
+        # Run tests in sequence. Registration doubles as the health check
+        # unless diagnostics were requested
+        if diag and not await self.test_backend_health():
+            self.stop("❌ Backend health check failed. Stopping tests.")
             return
 
-        if not self.test_user_registration():
-            print("❌ User registration failed. Stopping tests.")
+        if not await self.test_user_registration():
+            if not self.test_results.get("Backend Health", (True,))[0]:
+                self.stop("❌ Backend health check failed. Stopping tests.")
+            else:
+                self.stop("❌ User registration failed. Stopping tests.")
             return
 
-        if not self.test_user_login():
-            print("❌ User login failed. Stopping tests.")
+        if not await self.test_user_login():
+            self.stop("❌ User login failed. Stopping tests.")
             return
 
-        if not self.test_create_api_key():
-            print("❌ API key creation failed. Stopping tests.")
+        if not await self.test_create_api_key():
+            self.stop("❌ API key creation failed. Stopping tests.")
             return
 
-        if not self.test_chat_with_risk_detection():
-            print("❌ Chat with risk detection failed. Stopping tests.")
+        if not await self.test_chat_with_risk_detection():
+            if self._logs_task is not None:
+                self._logs_task.cancel()
+            self.stop("❌ Chat with risk detection failed. Stopping tests.")
             return
 
-        if not self.test_risk_logs_creation():
-            print("❌ Risk logs creation failed. Stopping tests.")
-            return
-
-        if not self.test_analytics_data():
-            print("❌ Analytics data test failed. Stopping tests.")
-            return
-
-        if not self.test_real_time_stats():
-            print("❌ Real-time stats test failed. Stopping tests.")
-            return
+        # The analytics endpoints are independent, so query them concurrently;
+        # the logs poll is usually already running from the chat probes
+        results = await asyncio.gather(
+            self._logs_task or self.test_risk_logs_creation(),
+            self.test_analytics_data(),
+            self.test_real_time_stats()
+        )
+        if not all(results):
+            self.stop("❌ Some analytics checks failed.")
 
         self.generate_summary()
 
     def generate_summary(self):
         """Generate test summary"""
+        self.flush_events()
         print("\n" + "=" * 50)
         print("📊 RISK LOGGING TEST SUMMARY")
         print("=" * 50)
 
         total_tests = len(self.test_results)
-        passed_tests = sum(1 for result in self.test_results.values() if result["success"])
+        passed_tests = sum(1 for success, _ in self.test_results.values() if success)
         failed_tests = total_tests - passed_tests
 
         print(f"Total Tests: {total_tests}")
@@ -405,9 +482,88 @@ class RiskLoggingTester:
             print("2. Check database connection and schema")
             print("3. Verify environment variables are set correctly")
 
+# Pytest entry points: the independent probes below can be spread across
+# processes with pytest-xdist, e.g. `pytest test_risk_logging.py -n 4 --dist=load`
+# (each worker bootstraps its own credentials through the session fixture)
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+CHAT_CASES = [
+    ("Low Risk Chat", LOW_RISK_BODY),
+    ("High Risk Chat", HIGH_RISK_BODY),
+    ("Data Access Request", DATA_REQUEST_BODY)
+]
+ANALYTICS_PATHS = [
+    "/api/v1/analytics/logs?limit=10",
+    "/api/v1/analytics/statistics?days=1",
+    "/api/v1/analytics/real-time-stats"
+]
+
+async def _bootstrap_credentials():
+    """Register, log in and create an API key; return (auth_token, api_key) or None"""
+    tester = RiskLoggingTester()
+    try:
+        for step in (tester.test_backend_health, tester.test_user_registration,
+                     tester.test_user_login, tester.test_create_api_key):
+            if not await step():
+                return None
+        return tester.auth_token, tester.api_key
+    finally:
+        tester.flush_events()
+        await tester.client.aclose()
+
+def _send(client, method, path, token, body=None, timeout=CLIENT_TIMEOUT):
+    return client.request(method, path, content=body, headers={"Authorization": f"Bearer {token}"}, timeout=timeout)
+
+if pytest is not None:
+    @pytest.fixture(scope="session")
+    def credentials():
+        """Authenticate once per session (once per worker under xdist)"""
+        creds = asyncio.run(_bootstrap_credentials())
+        if creds is None:
+            pytest.skip("Backend unavailable or authentication bootstrap failed")
+        return creds
+
+    @pytest.fixture(scope="session")
+    def http_client():
+        """One keep-alive client shared by every probe in the session"""
+        with httpx.Client(
+            base_url=BACKEND_URL,
+            headers={"Content-Type": "application/json"},
+            timeout=CLIENT_TIMEOUT
+        ) as client:
+            yield client
+
+    @pytest.mark.parametrize("label,body", CHAT_CASES, ids=[label for label, _ in CHAT_CASES])
+    def test_chat_case(credentials, http_client, label, body):
+        _, api_key = credentials
+        response = _send(http_client, "POST", "/v1/chat/completions", api_key, body, timeout=CHAT_TIMEOUT)
+        assert response.status_code == 200, f"{label}: status {response.status_code}"
+
+    @pytest.mark.parametrize("path", ANALYTICS_PATHS)
+    def test_analytics_endpoint(credentials, http_client, path):
+        auth_token, _ = credentials
+        response = _send(http_client, "GET", path, auth_token)
+        assert response.status_code == 200, f"{path}: status {response.status_code}"
+
+async def run_tester(tester, diag=False):
+    """Run the full test flow, closing the tester's HTTP client afterwards"""
+    try:
+        await tester.run_complete_test(diag)
+    finally:
+        tester.flush_events()
+        await tester.client.aclose()
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--diag", action="store_true",
+                        help="run an explicit /health check before registration")
+    args = parser.parse_args()
+
     tester = RiskLoggingTester()
-    tester.run_complete_test()
+    _run(run_tester(tester, args.diag))
 
 if __name__ == "__main__":
     main()